@@ -1,8 +1,16 @@
 from huggingface_hub import list_datasets
 
-# Open file once and stream dataset IDs into it
-with open("all_dataset_ids.txt", "w") as f:
+# Stream dataset IDs into the file through a local byte buffer so the hot
+# loop does one buffered write per ~64 KiB instead of one per ID.
+with open("all_dataset_ids.txt", "wb", buffering=1 << 20) as f:
+    buf = bytearray()
     for ds in list_datasets():   # this yields datasets lazily
-        f.write(ds.id + "\n")
+        buf += ds.id.encode()
+        buf += b"\n"
+        if len(buf) >= 1 << 16:
+            f.write(buf)
+            buf.clear()
+    if buf:
+        f.write(buf)
 
-print("Finished writing all dataset IDs to all_dataset_ids.txt")
\ No newline at end of file
+print("Finished writing all dataset IDs to all_dataset_ids.txt")
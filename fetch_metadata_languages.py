@@ -4,10 +4,10 @@
 """
 Fetch all Hugging Face dataset IDs and their language tags.
 
-For each dataset, the script:
-  - reads its tags
-  - extracts all tags of the form "language:XXX"
-  - stores a combined Parquet file with columns:
+Instead of crawling full metadata for every dataset and discarding the ones
+without language tags, the script asks the Hub for its canonical language tag
+list and runs one server-side filtered query per language, so only matching
+datasets are ever transferred. Stores a combined Parquet file with columns:
         id, languages_final
 
 Usage:
@@ -15,24 +15,38 @@ Usage:
 """
 
 import argparse
-from collections import defaultdict
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-import pandas as pd
+import polars as pl
+import requests
 from huggingface_hub import HfApi
 
+TAGS_BY_TYPE_URL = "https://huggingface.co/api/datasets-tags-by-type"
 
-def extract_languages_from_tags(tags):
-    """Return a sorted list of language codes from a list of tags."""
-    if not tags:
-        return []
-    langs = []
-    for t in tags:
-        if t.startswith("language:"):
-            val = t.split("language:", 1)[1]
-            if val:
-                langs.append(val)
-    return sorted(set(langs))
+
+def load_facet_tags(facet, cache_path, token=None):
+    """Return the Hub's canonical tag ids for one facet (e.g. "language:en").
+
+    The list changes rarely, so it is cached locally; delete the cache file
+    to force a refresh.
+    """
+    if cache_path.exists():
+        return json.loads(cache_path.read_text())
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    r = requests.get(TAGS_BY_TYPE_URL, params={"type": facet},
+                     headers=headers, timeout=30)
+    r.raise_for_status()
+    tags = [t["id"] for t in r.json().get(facet, [])]
+    cache_path.write_text(json.dumps(tags))
+    return tags
+
+
+def fetch_tag(api, tag, token):
+    """Fetch all dataset IDs carrying one tag (independent HTTP crawl)."""
+    results = api.list_datasets(filter=[tag], full=False, token=token)
+    return [r.id for r in results]
 
 
 def main():
@@ -48,60 +62,60 @@ def main():
 
     api = HfApi()
 
-    print("[info] Fetching all datasets with full metadata ...")
-    # limit=None → fetch all datasets
-    results = list(api.list_datasets(full=True, token=args.token, limit=None))
-    print(f"[info] Retrieved {len(results)} datasets")
-
-    all_rows = []
-    lang_to_ids = defaultdict(list)
-
-    for r in results:
-        langs = extract_languages_from_tags(getattr(r, "tags", None))
-        if not langs:
-            continue
-
-        all_rows.append({
-            "id": r.id,
-            "languages_final": ";".join(langs),
-        })
-
-        for lang in langs:
-            lang_to_ids[lang].append(r.id)
-
-    if not all_rows:
+    tags = load_facet_tags("language", out_dir / "datasets_tags_language.json", args.token)
+    print(f"[info] Fetching datasets for {len(tags)} language tags ...")
+
+    # Each per-language crawl is independent HTTP I/O, so run them concurrently;
+    # datasets without language tags never cross the wire at all.
+    pairs = []  # long-form rows: (id, language)
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        futures = {ex.submit(fetch_tag, api, tag, args.token): tag for tag in tags}
+        for fut in as_completed(futures):
+            tag = futures[fut]
+            lang = tag.split(":", 1)[1]
+            try:
+                ids = fut.result()
+            except Exception as e:
+                print(f"  [error] {tag}: {e}")
+                ids = []
+            pairs.extend((dsid, lang) for dsid in ids)
+
+    long = pl.DataFrame(pairs, schema=["id", "language"], orient="row").unique()
+
+    if long.is_empty():
         print("[warn] No datasets with language tags found.")
         return
 
-    # Combined Parquet (one row per dataset with all its languages)
-    df = pd.DataFrame(all_rows).drop_duplicates(subset=["id"])
+    # Combined Parquet (one row per dataset with all its languages). Polars
+    # keeps the unique/sort/join aggregation in compiled kernels instead of
+    # calling a Python lambda once per ID.
+    df = (
+        long.group_by("id")
+        .agg(pl.col("language").unique().sort().str.join(";").alias("languages_final"))
+        .sort("id")
+    )
     out_parquet = out_dir / "metadata_languages.parquet"
-    df.to_parquet(out_parquet, index=False)
+    df.write_parquet(out_parquet)
 
     print(f"\n[✓] Saved combined {len(df)} datasets → {out_parquet}\n")
 
     # Simple summary of language counts
     print("Top languages (by number of datasets):\n")
-    lang_counts = (
-        df["languages_final"]
-        .str.split(";", expand=True)
-        .stack()
-        .value_counts()
-    )
+    lang_counts = long["language"].value_counts(sort=True)
     print(f"\nTotal number of unique languages: {len(lang_counts)}")
-    print(lang_counts.head(50).to_string())
-    
+    print(lang_counts.head(50))
+
 
     # Optional: one txt file per language (can be 8k+ files)
     if args.write_per_language:
         print("\n[info] Writing per-language id lists ...")
-        for lang, ids in lang_to_ids.items():
+        for (lang,), grp in long.group_by("language"):
             txt_path = out_dir / f"ids_language_{lang}.txt"
             with open(txt_path, "w", encoding="utf-8") as f:
-                for dsid in sorted(set(ids)):
+                for dsid in grp["id"].unique().sort():
                     f.write(dsid + "\n")
-        print(f"[✓] Wrote {len(lang_to_ids)} language files in {out_dir}")
+        print(f"[✓] Wrote {long['language'].n_unique()} language files in {out_dir}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
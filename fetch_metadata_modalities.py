@@ -14,11 +14,17 @@ Usage:
 """
 
 import os
-import pandas as pd
+import polars as pl
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from huggingface_hub import HfApi
 import argparse
 
+def fetch_modality(api, mod, token):
+    """Fetch all dataset IDs carrying modality:<mod> (one independent HTTP crawl)."""
+    results = api.list_datasets(filter=[f"modality:{mod}"], full=False, token=token)
+    return [r.id for r in results]
+
 def main():
     parser = argparse.ArgumentParser(description="Fetch Hugging Face datasets grouped by modality.")
     parser.add_argument("--out-dir", default="metadata", help="Output directory for lists and combined parquet")
@@ -36,43 +42,40 @@ def main():
     api = HfApi()
     all_rows = []
 
-    for mod in modalities:
-        tag = f"modality:{mod}"
-        print(f"[info] Fetching datasets for {tag} ...")
-        try:
-            results = list(api.list_datasets(filter=[tag], full=False, token=args.token))
-            ids = [r.id for r in results]
-            print(f"  → found {len(ids)} datasets")
-        except Exception as e:
-            print(f"  [error] {mod}: {e}")
-            ids = []
-
-        # save to text file
-        #txt_path = OUT_DIR / f"ids_{mod}.txt"
-        #with open(txt_path, "w", encoding="utf-8") as f:
-        #    for dsid in ids:
-        #        f.write(dsid + "\n")
-
-        # add to combined table
-        all_rows.extend([{"id": dsid, "modality": mod} for dsid in ids])
+    # each modality crawl is independent HTTP I/O, so run them concurrently
+    print(f"[info] Fetching datasets for {len(modalities)} modality tags ...")
+    with ThreadPoolExecutor(max_workers=len(modalities)) as ex:
+        futures = {ex.submit(fetch_modality, api, mod, args.token): mod for mod in modalities}
+        for fut in as_completed(futures):
+            mod = futures[fut]
+            try:
+                ids = fut.result()
+                print(f"  → modality:{mod}: found {len(ids)} datasets")
+            except Exception as e:
+                print(f"  [error] {mod}: {e}")
+                ids = []
+
+            # add to combined table
+            all_rows.extend([{"id": dsid, "modality": mod} for dsid in ids])
 
     # save combined parquet
     if all_rows:
-        df = pd.DataFrame(all_rows)
+        # Polars keeps the unique/sort/join aggregation in compiled kernels
+        # instead of calling a Python lambda once per ID.
         df = (
-            df.groupby("id")["modality"]
-            .apply(lambda s: ";".join(sorted(set(s))))
-            .reset_index(name="modalities_final")
+            pl.from_dicts(all_rows)
+            .group_by("id")
+            .agg(pl.col("modality").unique().sort().str.join(";").alias("modalities_final"))
+            .sort("id")
         )
 
         out_parquet = OUT_DIR / "metadata_modalities.parquet"
-        df.to_parquet(out_parquet, index=False)
+        df.write_parquet(out_parquet)
 
         # --- summary ---
         print(f"\n[✓] Saved combined {len(df)} datasets → {out_parquet}\n")
         print("Modality combinations:\n")
-        counts = df["modalities_final"].value_counts()
-        print(counts.to_string())
+        print(df["modalities_final"].value_counts(sort=True))
 
     else:
         print("[warn] No datasets retrieved for any modality.")
@@ -4,10 +4,10 @@
 """
 Fetch all Hugging Face dataset IDs and their region tags.
 
-For each dataset:
-  - reads its tags
-  - extracts all tags of the form "region:XXX"
-  - stores a combined Parquet file with columns:
+Instead of crawling full metadata for every dataset and discarding the ones
+without region tags, the script asks the Hub for its canonical region tag
+list and runs one server-side filtered query per region, so only matching
+datasets are ever transferred. Stores a combined Parquet file with columns:
         id, regions_final
 
 Usage:
@@ -15,24 +15,38 @@ Usage:
 """
 
 import argparse
-from collections import defaultdict
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-import pandas as pd
+import polars as pl
+import requests
 from huggingface_hub import HfApi
 
+TAGS_BY_TYPE_URL = "https://huggingface.co/api/datasets-tags-by-type"
 
-def extract_regions_from_tags(tags):
-    """Return a sorted list of region codes from a list of tags."""
-    if not tags:
-        return []
-    regs = []
-    for t in tags:
-        if t.startswith("region:"):
-            val = t.split("region:", 1)[1]
-            if val:
-                regs.append(val)
-    return sorted(set(regs))
+
+def load_facet_tags(facet, cache_path, token=None):
+    """Return the Hub's canonical tag ids for one facet (e.g. "region:us").
+
+    The list changes rarely, so it is cached locally; delete the cache file
+    to force a refresh.
+    """
+    if cache_path.exists():
+        return json.loads(cache_path.read_text())
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    r = requests.get(TAGS_BY_TYPE_URL, params={"type": facet},
+                     headers=headers, timeout=30)
+    r.raise_for_status()
+    tags = [t["id"] for t in r.json().get(facet, [])]
+    cache_path.write_text(json.dumps(tags))
+    return tags
+
+
+def fetch_tag(api, tag, token):
+    """Fetch all dataset IDs carrying one tag (independent HTTP crawl)."""
+    results = api.list_datasets(filter=[tag], full=False, token=token)
+    return [r.id for r in results]
 
 
 def main():
@@ -49,57 +63,58 @@ def main():
 
     api = HfApi()
 
-    print("[info] Fetching all datasets with full metadata ...")
-    results = list(api.list_datasets(full=True, token=args.token, limit=None))
-    print(f"[info] Retrieved {len(results)} datasets")
-
-    all_rows = []
-    region_to_ids = defaultdict(list)
-
-    for r in results:
-        regs = extract_regions_from_tags(getattr(r, "tags", None))
-        if not regs:
-            continue
-
-        all_rows.append({
-            "id": r.id,
-            "regions_final": ";".join(regs),
-        })
-
-        for reg in regs:
-            region_to_ids[reg].append(r.id)
-
-    if not all_rows:
+    tags = load_facet_tags("region", out_dir / "datasets_tags_region.json", args.token)
+    print(f"[info] Fetching datasets for {len(tags)} region tags ...")
+
+    # Each per-region crawl is independent HTTP I/O, so run them concurrently;
+    # datasets without region tags never cross the wire at all.
+    pairs = []  # long-form rows: (id, region)
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        futures = {ex.submit(fetch_tag, api, tag, args.token): tag for tag in tags}
+        for fut in as_completed(futures):
+            tag = futures[fut]
+            reg = tag.split(":", 1)[1]
+            try:
+                ids = fut.result()
+            except Exception as e:
+                print(f"  [error] {tag}: {e}")
+                ids = []
+            pairs.extend((dsid, reg) for dsid in ids)
+
+    long = pl.DataFrame(pairs, schema=["id", "region"], orient="row").unique()
+
+    if long.is_empty():
         print("[warn] No datasets with region tags found.")
         return
 
-    df = pd.DataFrame(all_rows).drop_duplicates(subset=["id"])
+    # Polars keeps the unique/sort/join aggregation in compiled kernels
+    # instead of calling a Python lambda once per ID.
+    df = (
+        long.group_by("id")
+        .agg(pl.col("region").unique().sort().str.join(";").alias("regions_final"))
+        .sort("id")
+    )
     out_parquet = out_dir / "metadata_regions.parquet"
-    df.to_parquet(out_parquet, index=False)
+    df.write_parquet(out_parquet)
 
     print(f"\n[✓] Saved combined {len(df)} datasets → {out_parquet}\n")
 
     # summary
     print("Top regions (by number of datasets):\n")
-    region_counts = (
-        df["regions_final"]
-        .str.split(";", expand=True)
-        .stack()
-        .value_counts()
-    )
+    region_counts = long["region"].value_counts(sort=True)
     print(f"\nTotal number of unique regions: {len(region_counts)}")
-    print(region_counts.head(50).to_string())
+    print(region_counts.head(50))
 
     # optional per-region txts
     if args.write_per_region:
         print("\n[info] Writing per-region id lists ...")
-        for reg, ids in region_to_ids.items():
+        for (reg,), grp in long.group_by("region"):
             txt_path = out_dir / f"ids_region_{reg}.txt"
             with open(txt_path, "w", encoding="utf-8") as f:
-                for dsid in sorted(set(ids)):
+                for dsid in grp["id"].unique().sort():
                     f.write(dsid + "\n")
-        print(f"[✓] Wrote {len(region_to_ids)} region files in {out_dir}")
+        print(f"[✓] Wrote {long['region'].n_unique()} region files in {out_dir}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -5,18 +5,21 @@
 REST-only fetch of (createdAt, lastModified, downloadsAllTime, downloads) for dataset IDs.
 
 - Uses https://huggingface.co/api/datasets/<id> (single REST call per ID)
-- Parallel threads, jittered delay, retries & backoff
+- Async (aiohttp), jittered delay, retries & backoff
+- Checkpoints append to one Arrow IPC stream per prefix; parquet written once at the end
 - Resumable: skips IDs already present in parts/ or --out
 - Safe parallel runs with different --part-prefix (or auto user@host)
 """
 
-import os, re, json, time, argparse, random, socket, getpass, datetime as dt
+import os, json, time, argparse, random, socket, getpass, sqlite3, threading, queue, datetime as dt
 from pathlib import Path
 from urllib.parse import quote
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import pandas as pd
-import requests
+import asyncio
+import aiohttp
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from tqdm import tqdm
 
 # ---------------- CLI ----------------
@@ -25,162 +28,409 @@ p.add_argument("--ids-file", required=True, help="TXT with one dataset ID per li
 p.add_argument("--parts-dir", default="parts", help="Directory for checkpoint parts.")
 p.add_argument("--part-prefix", default=None, help="Filename prefix for parts (default: user@host).")
 p.add_argument("--out", default="core_rest.parquet", help="Merged parquet (rewritten during merges).")
-p.add_argument("--threads", type=int, default=4, help="Worker threads.")
+p.add_argument("--threads", type=int, default=4, help="Concurrency factor (max in-flight requests = threads*32).")
 p.add_argument("--sleep", type=float, default=0.25, help="Polite per-request delay (seconds, jittered).")
 p.add_argument("--batch-size", type=int, default=2000, help="Rows per checkpoint write.")
-p.add_argument("--merge-every-parts", type=int, default=5, help="Merge final after every N parts.")
 p.add_argument("--token", default=os.getenv("HF_TOKEN"), help="HF token (or env HF_TOKEN).")
 p.add_argument("--ua", default="Datalifecycle/0.1 (contact: you@example.com)", help="Custom User-Agent.")
+p.add_argument("--http-cache", default=None,
+               help="SQLite file for ETag-conditional response cache ('' disables; "
+                    "default: hf_http_cache_replevel_<part-prefix>.sqlite).")
 args = p.parse_args()
 
 IDS_FILE   = Path(args.ids_file)
 PARTS_DIR  = Path(args.parts_dir); PARTS_DIR.mkdir(parents=True, exist_ok=True)
 OUT_PATH   = Path(args.out);       OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 PART_PREFIX = args.part_prefix or f"{getpass.getuser()}@{socket.gethostname()}"
+STREAM_PATH = PARTS_DIR / f"{PART_PREFIX}.arrow"
 
 THREADS = max(1, args.threads)
 DELAY   = max(0.0, args.sleep)
 BATCH   = max(1, args.batch_size)
 HF_TOKEN = args.token
 UA = {"User-Agent": args.ua}
-http = requests.Session()
+CONCURRENCY = THREADS * 32  # in-flight requests sharing one event loop
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# constant across every request, so build it once instead of per call
+PARAMS = [("expand", v) for v in
+          ("downloads","downloadsAllTime","createdAt","lastModified", "trendingScore", "likes", "usedStorage")] #, "tags"
+
+# Declared once so parts never depend on pandas dtype inference; error rows
+# simply leave error_message null.
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("created_at", pa.string()),
+    ("last_modified", pa.string()),
+    ("downloads_30d", pa.int64()),
+    ("downloads_all_time", pa.int64()),
+    ("trending_score", pa.float64()),
+    ("likes", pa.int64()),
+    ("used_storage", pa.int64()),
+    ("status", pa.string()),
+    ("error_message", pa.string()),
+    ("fetch_timestamp", pa.string()),
+])
 
 # ---------------- Helpers ----------------
-def polite_sleep():
+async def polite_sleep():
     if DELAY > 0:
-        time.sleep(DELAY * (0.9 + 0.4 * random.random()))
+        await asyncio.sleep(DELAY * (0.9 + 0.4 * random.random()))
 
-def read_ids(pth: Path) -> list[str]:
-    with open(pth, "r", encoding="utf-8") as f:
-        return [ln.strip() for ln in f if ln.strip()]
+class ResponseCache:
+    """Tiny sqlite cache of url -> (etag, body) for conditional re-fetches.
 
-def list_existing_ids(parts_dir: Path, final_path: Path) -> set[str]:
-    done = set()
-    if final_path.exists():
+    On reruns we send If-None-Match; a 304 costs one RTT with no body and the
+    stored JSON is reused, so unchanged datasets skip re-discovery entirely.
+    Each run gets its own cache file by default; if callers do point several
+    processes at one file, lock contention degrades to skipped cache writes
+    rather than aborting the crawl.
+    """
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, etag TEXT, body BLOB)"
+        )
+        self._dirty = 0
+        self._last_commit = time.monotonic()
+
+    def get(self, url):
         try:
-            df = pd.read_parquet(final_path, columns=["id"])
-            done |= set(df["id"].astype(str))
-        except Exception:
+            row = self.conn.execute(
+                "SELECT etag, body FROM responses WHERE url=?", (url,)
+            ).fetchone()
+        except sqlite3.OperationalError:  # locked past the busy timeout
+            return (None, None)
+        return row if row else (None, None)
+
+    def put(self, url, etag, body):
+        if not etag:
+            return
+        try:
+            self.conn.execute(
+                "REPLACE INTO responses (url, etag, body) VALUES (?,?,?)", (url, etag, body)
+            )
+            # batch commits: a per-put commit would serialize the event loop
+            # on disk syncs. The time bound keeps the open write transaction
+            # short so a concurrent process never waits long for the lock.
+            self._dirty += 1
+            now = time.monotonic()
+            if self._dirty >= 256 or now - self._last_commit > 1.0:
+                self.conn.commit()
+                self._dirty = 0
+                self._last_commit = now
+        except sqlite3.OperationalError:
+            # skipping one cache write is cheaper than aborting the crawl
+            pass
+
+    def close(self):
+        try:
+            self.conn.commit()
+        except sqlite3.OperationalError:
             pass
-    for pth in parts_dir.glob("*.parquet"):
+        self.conn.close()
+
+HTTP_CACHE = (args.http_cache if args.http_cache is not None
+              else f"hf_http_cache_replevel_{PART_PREFIX}.sqlite")
+CACHE = ResponseCache(HTTP_CACHE) if HTTP_CACHE else None
+
+def _now_iso() -> str:
+    return dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+def compute_backoff(resp, attempt, base=1.0, cap=30.0) -> float:
+    """Delay before the next retry: honor Retry-After if present, else full jitter."""
+    if resp is not None:
+        ra = resp.headers.get("Retry-After")
+        if ra:
+            try:
+                return min(float(ra), 120.0)
+            except ValueError:
+                pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def read_ids(pth: Path) -> pa.Array:
+    """Arrow string array of unique IDs from the file.
+
+    Deduplication hashes in C at ~20 bytes per entry instead of building a
+    Python set of str objects (~60 bytes each) — matters on the resume path
+    with a million-ID input file.
+    """
+    with open(pth, "r", encoding="utf-8") as f:
+        arr = pa.array((ln.strip() for ln in f if ln.strip()), pa.string())
+    return arr.unique()
+
+def read_stream_tables(path: Path) -> list[pa.Table]:
+    """Read every batch from an append-mode IPC stream file.
+
+    Each append session writes its own schema+batches segment, and a crashed
+    run can leave a truncated tail; read segments until the file is exhausted
+    and drop whatever the last partial batch left behind.
+    """
+    tables = []
+    with open(path, "rb") as f:
+        while True:
+            pos = f.tell()
+            batches = []
+            try:
+                reader = pa.ipc.open_stream(f)
+                for batch in reader:
+                    batches.append(batch)
+            except Exception:
+                pass  # end of file or truncated tail
+            if batches:
+                tables.append(pa.Table.from_batches(batches))
+            if f.tell() == pos:
+                break
+    return tables
+
+def checkpoint_tables(parts_dir: Path, final_path: Path) -> list[pa.Table]:
+    """All saved tables: IPC streams, legacy parquet parts, and the merged out."""
+    tables = []
+    for spath in sorted(parts_dir.glob("*.arrow")):
         try:
-            dfp = pd.read_parquet(pth, columns=["id"])
-            done |= set(dfp["id"].astype(str))
+            tables.extend(read_stream_tables(spath))
         except Exception:
             continue
-    return done
-
-def next_part_index(parts_dir: Path, prefix: str) -> int:
-    idxs = []
-    for pth in parts_dir.glob(f"{prefix}_part_*.parquet"):
-        m = re.search(rf"{re.escape(prefix)}_part_(\d+)\.parquet$", pth.name)
-        if m: idxs.append(int(m.group(1)))
-    return (max(idxs) + 1) if idxs else 1
-
-def write_part(rows: list[dict], parts_dir: Path, prefix: str, idx: int) -> Path:
-    out = parts_dir / f"{prefix}_part_{idx:06d}.parquet"
-    pd.DataFrame(rows).to_parquet(out, index=False)
-    print(f"[checkpoint] wrote {len(rows)} rows -> {out}")
-    return out
-
-def merge_parts(parts_dir: Path, final_path: Path):
-    files = sorted(parts_dir.glob("*.parquet"))
-    if not files:
-        print("[merge] no parts to merge.")
-        return
-    dfs = []
-    for f in files:
+    legacy = sorted(parts_dir.glob("*.parquet"))
+    if final_path.exists():
+        legacy.append(final_path)
+    for pth in legacy:
         try:
-            dfs.append(pd.read_parquet(f))
+            tables.append(pq.read_table(pth))
         except Exception:
             continue
-    if not dfs:
-        print("[merge] no readable parts.")
+    return tables
+
+def list_existing_ids(parts_dir: Path, final_path: Path) -> pa.ChunkedArray:
+    """Arrow string column of IDs already saved, no Python set."""
+    chunks = [t.column("id").combine_chunks() for t in checkpoint_tables(parts_dir, final_path)
+              if t.num_rows > 0]
+    return pa.chunked_array(chunks or [pa.array([], pa.string())])
+
+class Buf:
+    """Column-oriented result buffer (SoA): one typed list per column instead
+    of one dict per row, so flushes feed Arrow's typed constructors directly
+    and the hot loop allocates no per-row dicts."""
+    __slots__ = ("id", "created_at", "last_modified", "downloads_30d",
+                 "downloads_all_time", "trending_score", "likes",
+                 "used_storage", "status", "error_message")
+
+    def __init__(self):
+        self.clear()
+
+    def append(self, id, created_at, last_modified, downloads_30d,
+               downloads_all_time, trending_score, likes, used_storage,
+               status, error_message):
+        self.id.append(id)
+        self.created_at.append(created_at)
+        self.last_modified.append(last_modified)
+        self.downloads_30d.append(downloads_30d)
+        self.downloads_all_time.append(downloads_all_time)
+        self.trending_score.append(trending_score)
+        self.likes.append(likes)
+        self.used_storage.append(used_storage)
+        self.status.append(status)
+        self.error_message.append(error_message)
+
+    def __len__(self):
+        return len(self.id)
+
+    def clear(self):
+        for name in self.__slots__:
+            setattr(self, name, [])
+
+    def to_batch(self, ts: str) -> pa.RecordBatch:
+        return pa.record_batch([
+            pa.array(self.id, pa.string()),
+            pa.array(self.created_at, pa.string()),
+            pa.array(self.last_modified, pa.string()),
+            pa.array(self.downloads_30d, pa.int64()),
+            pa.array(self.downloads_all_time, pa.int64()),
+            pa.array(self.trending_score, pa.float64()),
+            pa.array(self.likes, pa.int64()),
+            pa.array(self.used_storage, pa.int64()),
+            pa.array(self.status, pa.string()),
+            pa.array(self.error_message, pa.string()),
+            pa.array([ts] * len(self.id), pa.string()),
+        ], schema=SCHEMA)
+
+_stream_file = None
+_stream_writer = None
+
+def append_batch(batch: pa.RecordBatch):
+    """Append one RecordBatch to the per-prefix IPC stream (crash-safe: each
+    batch is length-prefixed, a torn tail is skipped on restart)."""
+    global _stream_file, _stream_writer
+    if _stream_writer is None:
+        _stream_file = open(STREAM_PATH, "ab")
+        _stream_writer = pa.ipc.new_stream(_stream_file, SCHEMA)
+    _stream_writer.write_batch(batch)
+    _stream_file.flush()
+    print(f"[checkpoint] appended {batch.num_rows} rows -> {STREAM_PATH}")
+
+# Checkpoint writes happen on a dedicated thread that owns the stream handle:
+# the fetch loop hands finished batches over a small bounded queue, so disk
+# I/O overlaps further fetching instead of stalling the event loop. The bound
+# provides backpressure if the disk falls far behind.
+_write_queue = queue.Queue(maxsize=4)
+_writer_error = None
+
+def _writer_loop():
+    global _writer_error
+    while True:
+        batch = _write_queue.get()
+        if batch is None:
+            return
+        try:
+            append_batch(batch)
+        except Exception as e:  # disk full, permissions, ...
+            # remember the failure but keep draining, so producers never
+            # block forever on a full queue with a dead consumer; the error
+            # is re-raised on the next flush/close
+            _writer_error = e
+
+_writer_thread = threading.Thread(target=_writer_loop, daemon=True)
+_writer_thread.start()
+
+def close_stream():
+    global _stream_file, _stream_writer
+    _write_queue.put(None)  # sentinel: drain remaining batches, then exit
+    _writer_thread.join()
+    if _stream_writer is not None:
+        _stream_writer.close()
+        _stream_file.close()
+        _stream_writer = _stream_file = None
+    if _writer_error is not None:
+        raise _writer_error
+
+def finalize_output(parts_dir: Path, final_path: Path):
+    """One-shot conversion of all checkpoints to the merged parquet."""
+    tables = [t for t in checkpoint_tables(parts_dir, final_path) if t.num_rows > 0]
+    if not tables:
+        print("[finalize] nothing to write.")
         return
-    big = (pd.concat(dfs, ignore_index=True)
-             .sort_values("id")
-             .drop_duplicates("id", keep="last"))
-    big.to_parquet(final_path, index=False)
-    print(f"[merge] wrote {final_path}  (rows={len(big)})")
+    # legacy pandas-written parts store int columns as float64 (int+None
+    # becomes NaN) and may lack columns entirely (baseline ok-rows carried
+    # no error_message); fill the gaps with typed nulls and cast up front so
+    # concat never sees a schema mismatch
+    fixed = []
+    for t in tables:
+        for name in SCHEMA.names:
+            if name not in t.column_names:
+                t = t.append_column(name, pa.nulls(t.num_rows, SCHEMA.field(name).type))
+        fixed.append(t.select(SCHEMA.names).cast(SCHEMA))
+    tbl = pa.concat_tables(fixed)
+    # multithreaded Arrow sort, then keep the last (latest) row per id
+    tbl = tbl.sort_by([("id", "ascending"), ("fetch_timestamp", "ascending")])
+    ids = tbl.column("id").combine_chunks()
+    if len(ids) > 1:
+        keep = pc.not_equal(ids.slice(0, len(ids) - 1), ids.slice(1))
+        tbl = tbl.filter(pa.concat_arrays([keep, pa.array([True])]))
+    pq.write_table(tbl, final_path, compression="zstd")
+    print(f"[finalize] wrote {final_path}  (rows={tbl.num_rows})")
 
 # ---------------- Fetch (REST) ----------------
-def fetch_rest(repo_id: str) -> dict:
+async def fetch_rest(session: aiohttp.ClientSession, sem: asyncio.Semaphore, repo_id: str) -> tuple:
+    """Return one result as a tuple in Buf column order (no per-row dict)."""
+    # percent-encode once per ID, outside the retry loop
     url = f"https://huggingface.co/api/datasets/{quote(repo_id, safe='')}"
-    headers = {**UA, **({"Authorization": f"Bearer {HF_TOKEN}"} if HF_TOKEN else {})}
-    params = {
-        "expand": ["downloads","downloadsAllTime","createdAt","lastModified", "trendingScore", "likes", "usedStorage"] #, "tags"]
-    }
-    backoff = 1.0
-    for _ in range(6):
-        try:
-            r = http.get(url, headers=headers, params=params, timeout=25)
-            if r.status_code in (429, 500, 502, 503, 504):
-                time.sleep(backoff); backoff = min(backoff*2, 30); continue
-            r.raise_for_status()
-            js = r.json()
-            polite_sleep()
-
-            tags = js.get("tags") or []
-            # remove language tags (start with "language:")
-            tags = [t for t in tags if not t.startswith("language:")]
-            tags.sort()  # optional alphabetical sort
-            return {
-                "id": repo_id,
-                "created_at": js.get("createdAt"),
-                "last_modified": js.get("lastModified"),
-                "downloads_30d": js.get("downloads"),
-                "downloads_all_time": js.get("downloadsAllTime"),
-                "trending_score": js.get("trendingScore"),
-                "likes": js.get("likes"),
-                "used_storage": js.get("usedStorage"),
-                #"tags": tags,
-                "status": "ok",
-                "fetch_timestamp": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds").replace("+00:00","Z"),
-            }
-        except requests.RequestException:
-            time.sleep(backoff); backoff = min(backoff*2, 30)
-    return {
-        "id": repo_id, "created_at": None, "last_modified": None,
-        "downloads_30d": None, "downloads_all_time": None,
-        "trending_score": None, "likes": None, 
-        "used_storage": None, #"tags": None,
-        "status": "error",
-        "error_message": f"REST failed after retries for {repo_id}",
-        "fetch_timestamp": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds").replace("+00:00","Z"),
-    }
+    cached_etag, cached_body = CACHE.get(url) if CACHE else (None, None)
+    headers = {"If-None-Match": cached_etag} if cached_etag else {}
+    async with sem:
+        for attempt in range(6):
+            try:
+                async with session.get(url, params=PARAMS, headers=headers,
+                                       timeout=aiohttp.ClientTimeout(total=25)) as r:
+                    if r.status == 404:
+                        # gone/private: retrying 5 more times won't change anything
+                        return (repo_id, None, None, None, None, None, None, None,
+                                "not_found", None)
+                    if r.status in RETRY_STATUSES:
+                        await asyncio.sleep(compute_backoff(r, attempt)); continue
+                    if r.status == 304 and cached_body is not None:
+                        js = json.loads(cached_body)
+                    else:
+                        r.raise_for_status()
+                        body = await r.read()
+                        js = json.loads(body)
+                        if CACHE:
+                            CACHE.put(url, r.headers.get("ETag"), body)
+                await polite_sleep()
+
+                return (
+                    repo_id,
+                    js.get("createdAt"),
+                    js.get("lastModified"),
+                    js.get("downloads"),
+                    js.get("downloadsAllTime"),
+                    js.get("trendingScore"),
+                    js.get("likes"),
+                    js.get("usedStorage"),
+                    "ok",
+                    None,
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                await asyncio.sleep(compute_backoff(None, attempt))
+            except (ValueError, TypeError, AttributeError) as e:
+                # 200 with a non-JSON body (proxy/HTML error page) or an
+                # unexpected payload shape: record an error row, don't crash
+                return (repo_id, None, None, None, None, None, None, None,
+                        "error", f"bad response for {repo_id}: {e}")
+    return (repo_id, None, None, None, None, None, None, None,
+            "error", f"REST failed after retries for {repo_id}")
 
 # ---------------- Main ----------------
-ids_all = read_ids(IDS_FILE)
+ids_arr = read_ids(IDS_FILE)
 done = list_existing_ids(PARTS_DIR, OUT_PATH)
-todo = [i for i in ids_all if i not in done]
-print(f"[ids] total={len(ids_all)}  already_saved={len(done)}  to_process={len(todo)}")
+# membership test stays in vectorized Arrow kernels instead of a Python set
+todo = ids_arr.filter(pc.invert(pc.is_in(ids_arr, value_set=done))).to_pylist()
+print(f"[ids] total={len(ids_arr)}  already_saved={len(done)}  to_process={len(todo)}")
 
-rows_buffer = []
-part_idx = next_part_index(PARTS_DIR, PART_PREFIX) - 1
-parts_written = 0
+buf = Buf()
 
 def flush():
-    global rows_buffer, part_idx, parts_written
-    if not rows_buffer: return
-    part_idx += 1
-    write_part(rows_buffer, PARTS_DIR, PART_PREFIX, part_idx)
-    parts_written += 1
-    rows_buffer = []
-    if parts_written % max(1, args.merge_every_parts) == 0:
-        merge_parts(PARTS_DIR, OUT_PATH)
+    if not len(buf): return
+    if _writer_error is not None:
+        raise _writer_error  # surface checkpoint-write failures in the main thread
+    # one timestamp per flush keeps datetime formatting off the fetch path
+    _write_queue.put(buf.to_batch(_now_iso()))
+    buf.clear()
 
 if not todo:
-    print("[done] nothing to do; merging existing parts…")
-    merge_parts(PARTS_DIR, OUT_PATH)
+    print("[done] nothing to do; finalizing existing checkpoints…")
+    finalize_output(PARTS_DIR, OUT_PATH)
     raise SystemExit(0)
 
-with ThreadPoolExecutor(max_workers=THREADS) as ex:
-    futures = {ex.submit(fetch_rest, ds_id): ds_id for ds_id in todo}
-    for fut in tqdm(as_completed(futures), total=len(futures), desc="Fetching (REST)", unit="ds", dynamic_ncols=True):
-        rows_buffer.append(fut.result())
-        if len(rows_buffer) >= BATCH:
-            flush()
+async def main_async():
+    # Size the pool to the concurrency cap so keep-alive sockets are actually
+    # reused instead of being torn down (one TLS handshake per request otherwise).
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY, limit_per_host=CONCURRENCY,
+                                     keepalive_timeout=30, ttl_dns_cache=300)
+    sem = asyncio.Semaphore(CONCURRENCY)
+    headers = {**UA, **({"Authorization": f"Bearer {HF_TOKEN}"} if HF_TOKEN else {})}
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        tasks = [asyncio.ensure_future(fetch_rest(session, sem, ds_id)) for ds_id in todo]
+        for fut in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Fetching (REST)", unit="ds", dynamic_ncols=True):
+            buf.append(*(await fut))
+            if len(buf) >= BATCH:
+                flush()
+
+# libuv event loop: same API, much higher socket throughput at high concurrency
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
+asyncio.run(main_async())
 
 flush()
-merge_parts(PARTS_DIR, OUT_PATH)
+close_stream()
+if CACHE:
+    CACHE.close()
+finalize_output(PARTS_DIR, OUT_PATH)
 print(f"[done] final: {OUT_PATH}")
\ No newline at end of file
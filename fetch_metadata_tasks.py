@@ -16,7 +16,8 @@ Usage:
 import os
 import argparse
 from pathlib import Path
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import polars as pl
 from huggingface_hub import HfApi
 
 # ----------------------------- Task catalogue -----------------------------
@@ -95,6 +96,11 @@ TASK_TO_CATEGORY = {
     for task in tasks
 }
 
+def fetch_task(api, task, token):
+    """Fetch all dataset IDs carrying task_categories:<task> (independent HTTP crawl)."""
+    results = api.list_datasets(filter=[f"task_categories:{task}"], full=False, token=token)
+    return [r.id for r in results]
+
 def main():
     parser = argparse.ArgumentParser(description="Fetch Hugging Face datasets grouped by task, with category column.")
     parser.add_argument("--out-dir", default="metadata", help="Output directory for lists and combined parquet.")
@@ -107,26 +113,25 @@ def main():
     api = HfApi()
     all_rows = []  # long-form rows: {id, task, category}
 
-    # Iterate tasks by category so we can attach the category immediately
-    for category, tasks in CATEGORIES.items():
-        print(f"\n=== {category} ===")
-        for task in tasks:
-            tag = f"task_categories:{task}"
-            print(f"[info] Fetching datasets for {tag} ...")
+    # Each per-task crawl is independent HTTP I/O, so run them concurrently;
+    # the category is attached from TASK_TO_CATEGORY as results complete.
+    n_tasks = sum(len(ts) for ts in CATEGORIES.values())
+    print(f"[info] Fetching datasets for {n_tasks} task tags ...")
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        futures = {
+            ex.submit(fetch_task, api, task, args.token): task
+            for tasks in CATEGORIES.values() for task in tasks
+        }
+        for fut in as_completed(futures):
+            task = futures[fut]
+            category = TASK_TO_CATEGORY[task]
             try:
-                results = list(api.list_datasets(filter=[tag], full=False, token=args.token))
-                ids = [r.id for r in results]
-                print(f"  → found {len(ids)} datasets")
+                ids = fut.result()
+                print(f"  → {task} ({category}): found {len(ids)} datasets")
             except Exception as e:
                 print(f"  [error] {task}: {e}")
                 ids = []
 
-            # per-task text file
-            #txt_path = OUT_DIR / f"ids_{task.replace('/', '_')}.txt"
-            #with open(txt_path, "w", encoding="utf-8") as f:
-            #    for dsid in ids:
-            #        f.write(dsid + "\n")
-
             # add to long-form table
             all_rows.extend({"id": dsid, "task": task, "category": category} for dsid in ids)
 
@@ -134,39 +139,37 @@ def main():
         print("\n[warn] No datasets retrieved for any task category.")
         return
 
-    # Build combined wide table: id -> semicolon-joined tasks & categories
-    df_long = pd.DataFrame(all_rows)
-    # Aggregate tasks
-    tasks_wide = (
-        df_long.groupby("id")["task"]
-        .apply(lambda s: ";".join(sorted(set(s))))
-        .rename("tasks_final")
-    )
-    # Aggregate categories
-    cats_wide = (
-        df_long.groupby("id")["category"]
-        .apply(lambda s: ";".join(sorted(set(s))))
-        .rename("categories_final")
+    # Build combined wide table: id -> semicolon-joined tasks & categories.
+    # Polars keeps the unique/sort/join aggregation in compiled kernels instead
+    # of calling a Python lambda once per ID.
+    df_long = pl.from_dicts(all_rows)
+    df_wide = (
+        df_long.group_by("id")
+        .agg([
+            pl.col("task").unique().sort().str.join(";").alias("tasks_final"),
+            pl.col("category").unique().sort().str.join(";").alias("categories_final"),
+        ])
+        .sort("id")
     )
-    df_wide = pd.concat([tasks_wide, cats_wide], axis=1).reset_index()
 
     out_parquet = OUT_DIR / "metadata_tasks.parquet"
-    df_wide.to_parquet(out_parquet, index=False)
+    df_wide.write_parquet(out_parquet)
 
     print(f"\n[✓] Saved combined {len(df_wide)} datasets → {out_parquet}")
 
     # --- summaries ---
     print("\nTask combination counts (top 20):")
-    print(df_wide["tasks_final"].value_counts().head(20).to_string())
+    print(df_wide["tasks_final"].value_counts(sort=True).head(20))
 
     print("\nCategory coverage:")
     # Count datasets per category (multi-category datasets counted in each)
     cat_counts = (
-        df_long[["id", "category"]].drop_duplicates()
-        .groupby("category")["id"].nunique()
-        .sort_values(ascending=False)
+        df_long.unique(subset=["id", "category"])
+        .group_by("category")
+        .agg(pl.col("id").n_unique().alias("n_datasets"))
+        .sort("n_datasets", descending=True)
     )
-    print(cat_counts.to_string())
+    print(cat_counts)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file